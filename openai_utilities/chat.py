@@ -1,7 +1,7 @@
 from enum import Enum
 import os
 import openai
-from .tokenutils import count_tokens_for_messages, count_tokens_for_message, split_content, MESSAGE_TOKEN_LIMIT, CONTEXT_WINDOW
+from .tokenutils import count_tokens_for_message, is_within_token_limit_for_messages, split_content, MESSAGE_TOKEN_LIMIT, CONTEXT_WINDOW
 from icecream import ic
 from functools import reduce
 
@@ -43,7 +43,7 @@ def empty_context_window(thread, model):
 # this is also assuming that all system messages are bundled up at the top
 def slide_context_window(thread, model):
     # check to see if there is enough room for a large response. if there is just return what there is in the thread now
-    if count_tokens_for_messages(thread, model) <= CONTEXT_WINDOW[model] - MESSAGE_TOKEN_LIMIT[model]:
+    if is_within_token_limit_for_messages(thread, model, CONTEXT_WINDOW[model] - MESSAGE_TOKEN_LIMIT[model]):
         return thread
     # or else shave MESSAGE_TOKEN_LMIT worth of messages from the top
 
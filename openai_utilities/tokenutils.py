@@ -64,6 +64,75 @@ def count_tokens_for_messages(messages, model) -> int:
         [count_tokens_for_message(msg, model) for msg in messages]
     )
 
+# most token counts are only used to check whether something is under a limit. for those checks the estimator mode
+# decides from utf-8 byte and word counts and the model's calibrated estimate, and only runs the real tokenizer when those are not conclusive.
+# set this to False to always run the tokenizer
+ESTIMATE_TOKENS = True
+
+# (average utf-8 bytes per token, relative error bound) of each model's tokenizer, as returned by calibrate_token_estimate.
+# this is intentionally empty until each model is measured on a mixed corpus
+# (english prose, code, spaced digits/numbers, CJK and other non-english text). guessed values are NOT good enough:
+# e.g. cl100k makes "1 2 3 ..." about 1 byte per token and llama/mistral fall back to 1 token per byte for CJK.
+# models that are not in here are only checked against the byte and word count bounds before tokenizing
+TOKEN_ESTIMATE_CALIBRATION = {}
+
+# the whitespace that all supported tokenizers split words on.
+# str.split() also splits on characters like \x1c-\x1f which bert normalizers delete instead
+_WORD_SEPARATOR = re.compile(r"[ \t\n\r]+")
+_WORD_CHAR = re.compile(r"\w")
+
+# checks if a string fits within the given token limit. runs the tokenizer only when the bounds and the estimate are not conclusive
+def is_within_token_limit(text: str, model: str, limit: int) -> bool:
+    return _is_within_token_limit([text], model, limit, 0, lambda: count_tokens(text, model))
+
+# checks if an entire thread of messages fits within the given token limit
+def is_within_token_limit_for_messages(messages, model, limit: int) -> bool:
+    return _is_within_token_limit(
+        [value for msg in messages for value in msg.values()],
+        model,
+        limit,
+        _CHAT_MESSAGE_PADDING_TOKENS*len(messages),
+        lambda: count_tokens_for_messages(messages, model))
+
+# padding is the fixed number of tokens added on top of the texts. exact_count_func already includes it
+def _is_within_token_limit(texts: list[str], model: str, limit: int, padding: int, exact_count_func) -> bool:
+    if not ESTIMATE_TOKENS:
+        return exact_count_func() <= limit
+
+    byte_count = sum(len(text.encode("utf-8")) for text in texts)
+    limit -= padding
+    # hard bounds that hold for every supported tokenizer regardless of calibration:
+    # - byte level BPE never produces more tokens than bytes. sentencepiece may add 1 leading word boundary token per text
+    # - no token spans across a space, tab or line break, and a word with at least 1 letter/digit/underscore is never normalized away.
+    #   so each such word is at least 1 token
+    if byte_count + len(texts) <= limit:
+        return True
+    if sum(1 for text in texts for word in _WORD_SEPARATOR.split(text) if _WORD_CHAR.search(word)) > limit:
+        return False
+
+    # or else go by the measured estimate and its error bound if the model has been calibrated
+    if model in TOKEN_ESTIMATE_CALIBRATION:
+        bytes_per_token, error = TOKEN_ESTIMATE_CALIBRATION[model]
+        estimate = byte_count / bytes_per_token
+        if estimate * (1 + error) <= limit:
+            return True
+        if estimate * (1 - error) > limit:
+            return False
+    # the bounds are not conclusive. so count for real
+    return exact_count_func() <= limit + padding
+
+# measures (average utf-8 bytes per token, relative error bound) of a model from a list of sample texts.
+# the error bound is the worst relative difference between the estimate and the actual count across the samples,
+# so that the actual count always lies within estimate * (1 +/- error_bound)
+# use this offline to fill in TOKEN_ESTIMATE_CALIBRATION
+def calibrate_token_estimate(samples: list[str], model: str) -> tuple[float, float]:
+    samples = [(len(s.encode("utf-8")), count_tokens(s, model)) for s in samples if s.strip()]
+    if not samples:
+        raise ValueError("calibrate_token_estimate needs at least 1 non-empty sample text")
+    bytes_per_token = sum(b for b, _ in samples) / sum(t for _, t in samples)
+    error = max(abs(b / bytes_per_token - t) / (b / bytes_per_token) for b, t in samples)
+    return bytes_per_token, error
+
 # truncates the content to the message limit of the model
 def truncate_text(text: str, model: str) -> str:  
     try: # this works for chatgpt/openai.com models
@@ -83,26 +152,28 @@ NATURAL_LANGUAGE_DELIMITERS = ["\n\n", "\n", ". ", "? ", "! "]
 # binary split the text based on delimiter sequence and then returned the padded text
 # if no metadata_func is defined it will assume that the message is for chat. if metadata_func == None it will dead with the original text
 # NOTE: gte-large has a known issue where it will NOT retain the semantics of the text given and will return tokens joined by " "
+# this only applies to truncated output. content that already fits within the token limit is returned as is
 def split_content(text: str, model: str, delimiter_sequence = NATURAL_LANGUAGE_DELIMITERS, metadata_func = None) -> list[str]:
     text = text.strip() # remove leading and trailing whitespaces. By themselves they dont mean anything
     if not text: # if there is no content left after strip return
         return []
 
     content = metadata_func(text) if metadata_func != None else text    
-    # the whole content is higher than the token limit.
+    # the whole content fits within the token limit. so there is nothing to split or truncate
+    if is_within_token_limit(content, model, MESSAGE_TOKEN_LIMIT[model]):
+        return [content]
+    # or else the whole content is higher than the token limit.
     # so try to split in equal chucks based on delimeter sequence 
-    if count_tokens(content, model) > MESSAGE_TOKEN_LIMIT[model]:
-        for delimiter in delimiter_sequence:  
-            # splitting in 2 nearly equal sized parts help retain chunks of equal size and hence as much context as possible for both chunks     
-            # Note: send the text and NOT the whole padded content, because the idea is that each chunk needs to have padded metadata for reserving the content 
-            # Note: this will do a rough cut in the middle                
-            chunks = _split_in_half(text, model, delimiter)
-            # there are 2 chunks. process them recursively
-            if len(chunks) > 1:
-                return reduce(_add_func, [split_content(text = c, model = model, delimiter_sequence = delimiter_sequence, metadata_func=metadata_func) for c in chunks])                
-            # or else there is only 1 chunk and so move to the next delimeter to split it even further
-            
-    # either the padded content was less than the limit or 
+    for delimiter in delimiter_sequence:  
+        # splitting in 2 nearly equal sized parts help retain chunks of equal size and hence as much context as possible for both chunks     
+        # Note: send the text and NOT the whole padded content, because the idea is that each chunk needs to have padded metadata for reserving the content 
+        # Note: this will do a rough cut in the middle                
+        chunks = _split_in_half(text, model, delimiter)
+        # there are 2 chunks. process them recursively
+        if len(chunks) > 1:
+            return reduce(_add_func, [split_content(text = c, model = model, delimiter_sequence = delimiter_sequence, metadata_func=metadata_func) for c in chunks])                
+        # or else there is only 1 chunk and so move to the next delimeter to split it even further
+        
     # we tried chunking and its not going to get any smaller. so just truncate the content and return
     # this can happen if the padding content or a sentence is too large. you get what you get!
     return [truncate_text(text = content, model = model)] 